@@ -0,0 +1,150 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, current_app, request, jsonify
+from werkzeug.test import EnvironBuilder
+
+from utils.auth import AuthError, VERIFIED_TOKENS_KEY, verify_jwt
+from utils.errors import get_error_message
+from utils.resilience import DEADLINE_KEY, BackendUnavailable, current_deadline
+from utils.utils import USERS_BY_SUB_KEY, get_user_by_sub
+
+MAX_BATCH_REQUESTS = 50
+# sub-requests in flight per batch
+BATCH_CONCURRENCY = 4
+# threads shared by all batches in the process
+BATCH_POOL_SIZE = 32
+BATCH_PREFIXES = ("/users", "/courses")
+BATCH_METHODS = {"GET", "POST", "PATCH", "DELETE"}
+
+bp = Blueprint("batch", __name__)
+
+_executor_lock = threading.Lock()
+_executor = None
+
+
+@bp.errorhandler(AuthError)
+def handle_auth_error(ex):
+    response = jsonify(ex.error)
+    response.status_code = ex.status_code
+    return response
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=BATCH_POOL_SIZE, thread_name_prefix="batch"
+                )
+    return _executor
+
+
+def _valid_sub_request(item) -> bool:
+    """
+    Checks a sub-request targets a users/courses route
+    """
+    if not isinstance(item, dict):
+        return False
+
+    path, method = item.get("path"), item.get("method", "GET")
+    if not isinstance(path, str) or not isinstance(method, str):
+        return False
+    if method not in BATCH_METHODS:
+        return False
+
+    return any(
+        path == prefix or path.startswith(prefix + "/") or path.startswith(prefix + "?")
+        for prefix in BATCH_PREFIXES
+    )
+
+
+def _dispatch(app, environ: dict) -> dict:
+    """
+    Runs one sub-request through the app and captures its result
+    """
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:
+            return {"status": 500, "body": {"Error": "Unknown error!"}}
+
+    if response.is_json:
+        body = response.get_json(silent=True)
+    elif response.mimetype.startswith("text/"):
+        body = response.get_data(as_text=True)
+    else:
+        body = None
+
+    return {"status": response.status_code, "body": body}
+
+
+@bp.route("", methods=["POST"])
+def post_batch():
+    """
+    Runs a list of users/courses sub-requests with one auth verification
+    body: {"requests": [{"method": "PATCH", "path": "/courses/1", "body": {}}]}
+    Sub-requests run concurrently, so they shouldn't depend on each other
+    """
+    try:
+        payload = verify_jwt(request)
+        if not get_user_by_sub(payload["sub"]):
+            return get_error_message(403)
+
+        content = request.get_json(silent=True)
+        if not isinstance(content, dict) or not isinstance(
+            content.get("requests"), list
+        ):
+            return get_error_message(400)
+
+        items = content["requests"]
+        if not items or len(items) > MAX_BATCH_REQUESTS:
+            return get_error_message(400)
+
+        # sub-requests share the verified token, user lookups and deadline
+        shared = {
+            VERIFIED_TOKENS_KEY: request.environ[VERIFIED_TOKENS_KEY],
+            USERS_BY_SUB_KEY: request.environ[USERS_BY_SUB_KEY],
+            DEADLINE_KEY: current_deadline(),
+        }
+        app = current_app._get_current_object()
+        # bounds this batch's share of the pool, so one batch can't
+        # occupy every thread while others queue behind it
+        slots = threading.BoundedSemaphore(BATCH_CONCURRENCY)
+        futures = []
+        for item in items:
+            if not _valid_sub_request(item):
+                futures.append(None)
+                continue
+
+            builder = EnvironBuilder(
+                path=item["path"],
+                method=item.get("method", "GET"),
+                json=item.get("body"),
+                base_url=request.host_url,
+                headers={"Authorization": request.headers["Authorization"]},
+            )
+            environ = builder.get_environ()
+            environ.update(shared)
+            slots.acquire()
+            future = _get_executor().submit(_dispatch, app, environ)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+
+        responses = []
+        for future in futures:
+            if future is None:
+                responses.append(
+                    {"status": 400, "body": {"Error": "The request body is invalid"}}
+                )
+            else:
+                responses.append(future.result())
+
+        return {"responses": responses}
+
+    except BackendUnavailable:
+        return get_error_message(503)
+
+    except:
+        return get_error_message(401)
@@ -0,0 +1,64 @@
+"""
+Startup benchmark: import time and time-to-first-response
+
+Each run starts a fresh interpreter so module caches don't hide cold
+start costs. Run from the repository root:
+
+    python benchmarks/startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.app.test_client().get("/")
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (served - start) * 1000,
+    "status": response.status_code,
+}))
+"""
+
+
+def run_once() -> dict:
+    """
+    Measures one cold start in a fresh interpreter
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+
+    for metric in ("import_ms", "first_response_ms"):
+        values = [sample[metric] for sample in samples]
+        print(
+            f"{metric}: median={statistics.median(values):.1f} "
+            f"min={min(values):.1f} max={max(values):.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Throughput benchmark for gunicorn worker/thread settings
+
+Serves the app from gunicorn with an in-memory Datastore stand-in that
+adds a fixed latency per call (simulating RPC time), then drives
+GET /courses/<id> from concurrent clients. Run from the repository root:
+
+    python benchmarks/throughput.py --settings 1x1 1x8 2x4 2x8 --duration 10
+"""
+
+import argparse
+import http.client
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COURSES = 100
+
+
+def bench_app():
+    """
+    gunicorn app factory: benchmarks.throughput:bench_app()
+    """
+    from main import create_app
+    from tools.fault_injection import FaultyDatastoreClient, MemoryDatastoreClient
+    from utils.clients import new_entity
+
+    inner = MemoryDatastoreClient()
+    for course_id in range(1, COURSES + 1):
+        course = new_entity(inner.key("courses", course_id))
+        course.update(
+            {
+                "subject": "CS",
+                "number": course_id,
+                "title": "Course",
+                "term": "fall-24",
+                "instructor_id": 1,
+            }
+        )
+        inner.put(course)
+
+    latency = float(os.environ.get("BENCH_BACKEND_LATENCY", "0.02"))
+    datastore = FaultyDatastoreClient(inner, 0, 1, latency)
+
+    return create_app({"DATASTORE_CLIENT": datastore, "PROFILER": False})
+
+
+def _wait_for_server(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/")
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn didn't start")
+
+
+def _client(port: int, stop_at: float, latencies: list, errors: list):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            connection.request("GET", f"/courses/{random.randint(1, COURSES)}")
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def run_setting(workers: int, threads: int, args) -> dict:
+    """
+    Starts gunicorn with the given setting and measures it
+    """
+    env = {
+        **os.environ,
+        "PORT": str(args.port),
+        "GUNICORN_WORKERS": str(workers),
+        "GUNICORN_THREADS": str(threads),
+        "BENCH_BACKEND_LATENCY": str(args.backend_latency),
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "benchmarks.throughput:bench_app()",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for_server(args.port)
+        latencies, errors = [], []
+        stop_at = time.monotonic() + args.duration
+        clients = [
+            threading.Thread(
+                target=_client, args=(args.port, stop_at, latencies, errors)
+            )
+            for _ in range(args.concurrency)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / args.duration,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--settings", nargs="+", default=["1x1", "1x8", "2x8"])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--backend-latency", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    print("workers x threads | req/s | p50 ms | p99 ms | errors")
+    for setting in args.settings:
+        workers, threads = (int(part) for part in setting.split("x"))
+        result = run_setting(workers, threads, args)
+        print(
+            f"{setting:>17} | {result['rps']:5.0f} | {result['p50_ms']:6.1f} "
+            f"| {result['p99_ms']:6.1f} | {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,34 @@
 from flask import Blueprint, request, jsonify
-from google.cloud import datastore
+from urllib.parse import urlencode
+import base64
+import binascii
 
 from utils.auth import AuthError, verify_jwt
+from utils.clients import LazyDatastoreClient, new_entity, property_filter
 from utils.errors import get_error_message, check_error_400
+from utils.resilience import BackendUnavailable
+from utils.serializers import (
+    COURSE_FIELDS,
+    parse_fields,
+    serialize_course,
+    serialize_courses,
+)
 from utils.utils import (
     verify_admin,
     verify_student_sub,
     verify_instructor,
     verify_enrollment_data,
-    generate_url,
     generate_next_page_url,
+    generate_cursor_page_url,
+    build_course_query,
     get_user_by_sub,
     get_course_by_id,
-    get_student_enrollment,
+    get_courses_by_ids,
+    enrollment_key,
+    new_enrollment,
+    legacy_enrollment_keys,
+    put_in_batches,
+    delete_in_batches,
     cleanup_datastore_courses,
     cleanup_datastore_enrollment,
 )
@@ -21,11 +37,15 @@ CLIENT_ID = "****"
 CLIENT_SECRET = "****"
 DOMAIN = "****"
 
-client = datastore.Client()
+client = LazyDatastoreClient()
 
 bp = Blueprint("courses", __name__)
 
 course_properties = {"subject", "number", "title", "term", "instructor_id"}
+course_filters = {"term": str, "subject": str, "instructor_id": int, "number": int}
+course_sort_fields = {"subject", "number", "term"}
+
+MAX_BATCH_IDS = 100
 
 
 @bp.errorhandler(AuthError)
@@ -55,7 +75,7 @@ def post_course():
         if not verify_instructor(content["instructor_id"]):
             return get_error_message(400)
 
-        new_course = datastore.Entity(key=client.key("courses"))
+        new_course = new_entity(client.key("courses"))
         new_course.update(
             {
                 "subject": content["subject"],
@@ -66,21 +86,11 @@ def post_course():
             }
         )
         client.put(new_course)
-        new_course["id"] = new_course.key.id
-        resouce_url = generate_url("courses", new_course["id"])
 
-        return (
-            {
-                "id": new_course.key.id,
-                "subject": content["subject"],
-                "number": int(content["number"]),
-                "title": content["title"],
-                "term": content["term"],
-                "instructor_id": int(content["instructor_id"]),
-                "self": resouce_url,
-            },
-            201,
-        )
+        return serialize_course(new_course), 201
+
+    except BackendUnavailable:
+        return get_error_message(503)
 
     except:
         return get_error_message(401)
@@ -91,23 +101,76 @@ def get_courses():
     """
     Returns a paginated list of courses (default 3 items)
     Allows query and limit parameters to define pagination
+    Allows equality filters on term, subject, instructor_id and number,
+    a sort parameter (e.g. sort=-number) and cursor pagination
+    offset only applies to plain listings, cursor pages reject it
+    ?ids=1,2,3 returns those courses instead (see get_course_batch)
+    ?fields=id,title limits the returned properties
     """
+    try:
+        fields = parse_fields(request.args.get("fields"), COURSE_FIELDS)
+    except ValueError:
+        return get_error_message(400)
+
+    if "ids" in request.args:
+        try:
+            course_ids = [int(item) for item in request.args["ids"].split(",")]
+        except ValueError:
+            return get_error_message(400)
+        return course_batch_response(course_ids, fields)
+
+    try:
+        limit = int(request.args.get("limit", 3))
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return get_error_message(400)
+
+    if limit < 1 or offset < 0:
+        return get_error_message(400)
+
+    current_page = (offset // limit) + 1
+    cursor = request.args.get("cursor")
+    if cursor is not None:
+        # the client library only decodes cursors on the first page fetch,
+        # and skips characters outside the alphabet
+        try:
+            base64.b64decode(cursor, altchars=b"-_", validate=True)
+        except (binascii.Error, ValueError):
+            return get_error_message(400)
+
+    filters = {}
+    for name, cast in course_filters.items():
+        if name in request.args:
+            try:
+                filters[name] = cast(request.args[name])
+            except ValueError:
+                return get_error_message(400)
 
-    if request.args:
-        offset = int(request.args.get("offset"))
-        limit = int(request.args.get("limit"))
-        current_page = (offset // limit) + 1
+    sort = request.args.get("sort", "subject")
+    if sort.lstrip("-") not in course_sort_fields:
+        return get_error_message(400)
 
+    query = build_course_query(filters, sort, fields)
+
+    # filtered, sorted and cursor requests page with cursors so
+    # Datastore only reads the rows it returns
+    use_cursor = bool(filters) or cursor is not None or "sort" in request.args
+    if use_cursor and "offset" in request.args:
+        return get_error_message(400)
+
+    if use_cursor:
+        query_iterator = query.fetch(limit=limit, start_cursor=cursor)
     else:
-        limit = 3
-        offset = 0
-        current_page = 1
+        query_iterator = query.fetch(limit=limit, offset=offset)
 
-    query = client.query(kind="courses")
-    query.order = ["subject"]
-    query_iterator = query.fetch(limit=limit, offset=offset)
     pages = query_iterator.pages
-    results = list(next(pages))
+    try:
+        results = list(next(pages))
+    except Exception as ex:
+        # well-formed cursors that Datastore doesn't recognise
+        if cursor is not None and type(ex).__name__ == "InvalidArgument":
+            return get_error_message(400)
+        raise
 
     # clean out datastore courses (testing)
     # cleanup_datastore_courses()
@@ -115,32 +178,64 @@ def get_courses():
     # clean out datastore enrollment (testing)
     # cleanup_datastore_enrollment()
 
-    courses = []
-    for item in results:
-        course_url = generate_url("courses", item.key.id)
-        course = {
-            "id": item.key.id,
-            "subject": item["subject"],
-            "number": int(item["number"]),
-            "title": item["title"],
-            "term": item["term"],
-            "instructor_id": int(item["instructor_id"]),
-            "self": course_url,
-        }
-        courses.append(course)
+    courses = serialize_courses(results, fields)
 
     next_token = query_iterator.next_page_token
 
-    current_page += 1
-
     if next_token:
+        if use_cursor:
+            params = {**filters, "sort": sort}
+            if fields is not None:
+                params["fields"] = request.args["fields"]
+            if isinstance(next_token, bytes):
+                next_token = next_token.decode("ascii")
+            next_page = generate_cursor_page_url("courses", next_token, limit, params)
+            return {"courses": courses, "next": next_page}
+
+        current_page += 1
         next_offset = (current_page - 1) * limit
         next_page = generate_next_page_url("courses", offset=next_offset, limit=limit)
+        if fields is not None:
+            next_page += "&" + urlencode({"fields": request.args["fields"]})
         return {"courses": courses, "next": next_page}
 
     return {"courses": courses}
 
 
+@bp.route("/batch", methods=["POST"])
+def get_course_batch():
+    """
+    Retrieve several courses by id, body: {"ids": [1, 2, 3]}
+    Optional "fields": ["id", "title"] limits the returned properties
+    """
+    content = request.get_json(silent=True)
+    if not isinstance(content, dict) or not isinstance(content.get("ids"), list):
+        return get_error_message(400)
+
+    try:
+        course_ids = [int(item) for item in content["ids"]]
+        fields = content.get("fields")
+        if fields is not None:
+            fields = parse_fields(",".join(fields), COURSE_FIELDS)
+    except (TypeError, ValueError):
+        return get_error_message(400)
+
+    return course_batch_response(course_ids, fields)
+
+
+def course_batch_response(course_ids: list[int], fields: set = None):
+    """
+    Fetches courses in one round trip, preserving request order
+    and reporting missing ids (at most MAX_BATCH_IDS per request)
+    """
+    if not course_ids or len(course_ids) > MAX_BATCH_IDS:
+        return get_error_message(400)
+
+    courses, missing = get_courses_by_ids(course_ids)
+
+    return {"courses": serialize_courses(courses, fields), "missing": missing}
+
+
 @bp.route("/<int:course_id>", methods=["GET"])
 def get_course(course_id: int):
     """
@@ -150,16 +245,7 @@ def get_course(course_id: int):
     if not course:
         return get_error_message(404)
 
-    course_url = generate_url("courses", course_id)
-    return {
-        "id": course.key.id,
-        "subject": course["subject"],
-        "number": int(course["number"]),
-        "title": course["title"],
-        "term": course["term"],
-        "instructor_id": int(course["instructor_id"]),
-        "self": course_url,
-    }
+    return serialize_course(course)
 
 
 @bp.route("/<int:course_id>", methods=["PATCH"])
@@ -208,17 +294,10 @@ def patch_course(course_id: int):
         )
         client.put(course)
 
-        course_url = generate_url("courses", course_id)
+        return serialize_course(course)
 
-        return {
-            "id": course_id,
-            "subject": subject,
-            "number": number,
-            "title": title,
-            "term": term,
-            "instructor_id": instructor_id,
-            "self": course_url,
-        }
+    except BackendUnavailable:
+        return get_error_message(503)
 
     except:
         return get_error_message(401)
@@ -244,20 +323,18 @@ def delete_course(course_id: int):
 
         # clear out course from enrollment table
         query = client.query(kind="enrollment")
-        query.add_filter(
-            filter=datastore.query.PropertyFilter("course_id", "=", course_id)
-        )
-        results = list(query.fetch())
-
-        for item in results:
-            enrollment_key = client.key("enrollment", item.key.id)
-            client.delete(enrollment_key)
+        query.add_filter(filter=property_filter("course_id", "=", course_id))
+        query.keys_only()
+        delete_in_batches([item.key for item in query.fetch()])
 
         course_key = client.key("courses", course_id)
         client.delete(course_key)
 
         return "", 204
 
+    except BackendUnavailable:
+        return get_error_message(503)
+
     except:
         return get_error_message(401)
 
@@ -290,20 +367,33 @@ def update_course_enrollment(course_id: int):
         if not verify_enrollment_data(add_array, remove_array):
             return get_error_message(409)
 
-        for student in add_array:
-            if not get_student_enrollment(student, course_id):
-                new_enrollment = datastore.Entity(key=client.key("enrollment"))
-                new_enrollment.update({"student_id": student, "course_id": course_id})
-                client.put(new_enrollment)
+        # a commit may only touch each entity once, so repeated ids go
+        add_array = list(dict.fromkeys(add_array))
+        remove_array = list(dict.fromkeys(remove_array))
+
+        # enrollment keys are deterministic, so adds are idempotent upserts
+        # and removes don't need a lookup first. Until the migration has run,
+        # students with legacy rows are already enrolled and get no keyed
+        # row next to them, and removes also delete their legacy rows
+        put_in_batches(
+            [
+                new_enrollment(course_id, student)
+                for student in add_array
+                if not legacy_enrollment_keys(course_id, student)
+            ]
+        )
 
+        remove_keys = []
         for student in remove_array:
-            enrollment = get_student_enrollment(student, course_id)
-            if enrollment:
-                enrollment_key = client.key("enrollment", enrollment[0].key.id)
-                client.delete(enrollment_key)
+            remove_keys.append(enrollment_key(course_id, student))
+            remove_keys.extend(legacy_enrollment_keys(course_id, student))
+        delete_in_batches(list(dict.fromkeys(remove_keys)))
 
         return "", 200
 
+    except BackendUnavailable:
+        return get_error_message(503)
+
     except:
         return get_error_message(401)
 
@@ -330,9 +420,8 @@ def get_course_enrollment(course_id: int):
             return get_error_message(403)
 
         query = client.query(kind="enrollment")
-        query.add_filter(
-            filter=datastore.query.PropertyFilter("course_id", "=", course_id)
-        )
+        query.add_filter(filter=property_filter("course_id", "=", course_id))
+        query.projection = ["student_id"]
         results = list(query.fetch())
 
         result_array = []
@@ -341,5 +430,8 @@ def get_course_enrollment(course_id: int):
 
         return result_array
 
+    except BackendUnavailable:
+        return get_error_message(503)
+
     except:
         return get_error_message(401)
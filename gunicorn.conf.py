@@ -0,0 +1,44 @@
+# Gunicorn settings for App Engine, see app.yaml entrypoint
+#
+# Workers scale with the instance class's memory (GAE_MEMORY_MB); each
+# worker runs several threads since requests mostly wait on Datastore,
+# Cloud Storage and Auth0. GUNICORN_WORKERS / GUNICORN_THREADS override.
+# benchmarks/throughput.py compares settings.
+
+import os
+
+# GAE_MEMORY_MB -> workers: F1, F2, F4, F4_1G
+WORKERS_BY_MEMORY_MB = {384: 2, 768: 4, 1536: 8, 3072: 8}
+
+
+def _default_workers() -> int:
+    memory_mb = int(os.environ.get("GAE_MEMORY_MB", "0"))
+    workers = 1
+    for instance_memory, instance_workers in sorted(WORKERS_BY_MEMORY_MB.items()):
+        if memory_mb >= instance_memory:
+            workers = instance_workers
+    return workers
+
+
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", _default_workers()))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+worker_class = "gthread"
+timeout = 60
+keepalive = 75
+# load the app before forking so workers share imported modules, backend
+# clients are still built lazily inside each worker
+preload_app = True
+
+
+def post_worker_init(worker):
+    """
+    App Engine sends one /_ah/warmup per instance and only one worker gets
+    it, so every worker warms its own clients and caches once forked
+    (gRPC channels can't be created in the master before fork)
+    """
+    from utils.warmup import warm_up
+
+    with worker.wsgi.app_context():
+        report = warm_up()
+    worker.log.info("worker warmed up in %sms", report["total_ms"])
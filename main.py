@@ -1,40 +1,102 @@
-from flask import Flask
-from authlib.integrations.flask_client import OAuth
+from flask import Flask, current_app
 
-import users, courses
-
-
-app = Flask(__name__)
-app.secret_key = "SECRET_KEY"
-
-
-app.register_blueprint(users.bp, url_prefix="/users")
-app.register_blueprint(courses.bp, url_prefix="/courses")
+import users, courses, batch
+from utils import auth
+from utils.json_provider import OrjsonProvider
+from utils.metrics import init_metrics
+from utils.profiler import init_profiler
+from utils.resilience import init_resilience
+from utils.warmup import warm_up
 
 CLIENT_ID = "****"
 CLIENT_SECRET = "****"
 DOMAIN = "****"
 ALGORITHMS = ["****"]
 
-oauth = OAuth(app)
-
-auth0 = oauth.register(
-    "auth0",
-    client_id=CLIENT_ID,
-    client_secret=CLIENT_SECRET,
-    api_base_url="https://" + DOMAIN,
-    access_token_url="https://" + DOMAIN + "/oauth/token",
-    authorize_url="https://" + DOMAIN + "/authorize",
-    client_kwargs={
-        "scope": "openid profile email",
-    },
-)
+DEFAULT_CONFIG = {
+    "SECRET_KEY": "SECRET_KEY",
+    # pre-built backend clients for this app, e.g. pointed at the emulator,
+    # the shared lazily built clients are used when these are None
+    "DATASTORE_CLIENT": None,
+    "STORAGE_CLIENT": None,
+    "JWKS_TTL_SECONDS": auth.JWKS_TTL_SECONDS,
+    "METRICS": True,
+    "PROFILER": True,
+}
 
 
-@app.route("/")
 def index():
     return "Josquin Larsen, Tarpaulin"
 
 
+def warmup():
+    """
+    App Engine warmup request, primes backend clients before traffic arrives
+    """
+    return warm_up()
+
+
+def get_auth0():
+    """
+    Registers the Auth0 OAuth client on first use
+    """
+    app = current_app._get_current_object()
+    if "auth0" not in app.extensions:
+        from authlib.integrations.flask_client import OAuth
+
+        oauth = OAuth(app)
+        app.extensions["auth0"] = oauth.register(
+            "auth0",
+            client_id=CLIENT_ID,
+            client_secret=CLIENT_SECRET,
+            api_base_url="https://" + DOMAIN,
+            access_token_url="https://" + DOMAIN + "/oauth/token",
+            authorize_url="https://" + DOMAIN + "/authorize",
+            client_kwargs={
+                "scope": "openid profile email",
+            },
+        )
+    return app.extensions["auth0"]
+
+
+def create_app(config: dict = None) -> Flask:
+    """
+    Builds the app, wiring blueprints, backends and caches from config
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+
+    app.json = OrjsonProvider(app)
+    app.secret_key = app.config["SECRET_KEY"]
+
+    # per-app, so apps built with different configs don't override each other
+    clients = {
+        "datastore": app.config["DATASTORE_CLIENT"],
+        "storage": app.config["STORAGE_CLIENT"],
+    }
+    app.extensions["clients"] = {
+        name: client for name, client in clients.items() if client is not None
+    }
+
+    app.register_blueprint(users.bp, url_prefix="/users")
+    app.register_blueprint(courses.bp, url_prefix="/courses")
+    app.register_blueprint(batch.bp, url_prefix="/batch")
+    app.add_url_rule("/", view_func=index)
+    app.add_url_rule("/_ah/warmup", view_func=warmup)
+
+    if app.config["METRICS"]:
+        init_metrics(app)
+    init_resilience(app)
+    if app.config["PROFILER"]:
+        init_profiler(app)
+
+    return app
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=8080, debug=True)
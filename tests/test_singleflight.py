@@ -0,0 +1,47 @@
+import copy
+import threading
+import time
+
+from utils.singleflight import SingleFlight
+
+
+def test_leader_mutation_does_not_reach_waiter():
+    release = threading.Event()
+    mutated = threading.Event()
+    fetches = []
+
+    def share(result):
+        # the waiter only copies once the leader has mutated its result
+        if threading.current_thread().name == "waiter":
+            mutated.wait(timeout=5)
+        return copy.copy(result)
+
+    flight = SingleFlight("test", share=share)
+
+    def fetch():
+        fetches.append(1)
+        release.wait(timeout=5)
+        return {"title": "original"}
+
+    def leader():
+        result = flight.do("course", fetch)
+        result["title"] = "patched"
+        mutated.set()
+
+    results = {}
+    leader_thread = threading.Thread(target=leader, name="leader")
+    waiter_thread = threading.Thread(
+        target=lambda: results.update(waiter=flight.do("course", fetch)),
+        name="waiter",
+    )
+    leader_thread.start()
+    while not fetches:
+        time.sleep(0.001)
+    waiter_thread.start()
+    time.sleep(0.05)
+    release.set()
+    leader_thread.join(timeout=5)
+    waiter_thread.join(timeout=5)
+
+    assert len(fetches) == 1
+    assert results["waiter"] == {"title": "original"}
@@ -0,0 +1,344 @@
+"""
+Fault-injecting Datastore stand-ins for exercising deadlines, retries and
+hedged reads locally.
+
+FaultyTransport sits under the real datastore.Client and the generated
+gapic client, so the library's own retry/timeout handling is exercised
+exactly as in production. run() reports how many RPC attempts each lookup
+and each gapic call made; with --check it fails when a single gapic call
+retried on its own (the gapic default Retry nesting inside ours) or a
+lookup exceeded MAX_READ_ATTEMPTS.
+
+MemoryDatastoreClient / FaultyDatastoreClient are a lighter client-level
+stand-in used by benchmarks/throughput.py.
+
+Run from the repository root:
+
+    python -m tools.fault_injection --error-rate 0.2 --slow-rate 0.05 --check
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import threading
+import time
+
+from google.api_core.exceptions import DeadlineExceeded, ServiceUnavailable
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.datastore import helpers
+from google.cloud.datastore_v1.services.datastore import DatastoreClient
+from google.cloud.datastore_v1.services.datastore.transports.base import (
+    DEFAULT_CLIENT_INFO,
+    DatastoreTransport,
+)
+from google.cloud.datastore_v1.types import datastore as datastore_pb2
+from google.cloud.datastore_v1.types import query as query_pb2
+
+from utils import resilience
+from utils.resilience import BackendUnavailable
+
+PROJECT = "fault-injection"
+
+
+def _unsupported_rpc(name: str) -> property:
+    def rpc(request, timeout=None, metadata=()):
+        raise NotImplementedError(f"{name} isn't supported by FaultyTransport")
+
+    return property(lambda self: rpc)
+
+
+class FaultyTransport(DatastoreTransport):
+    """
+    In-memory gapic transport that delays or fails a fraction of RPCs
+    Slow calls longer than the RPC timeout raise DeadlineExceeded
+    """
+
+    def __init__(self, error_rate, slow_rate, slow_seconds, seed=None):
+        super().__init__(credentials=AnonymousCredentials())
+        self._error_rate = error_rate
+        self._slow_rate = slow_rate
+        self._slow_seconds = slow_seconds
+        self._random = random.Random(seed)
+        self._entities = {}
+        self._local = threading.local()
+        self._lookup = self._do_lookup
+        self._run_query = self._do_run_query
+        self._prep_wrapped_messages(DEFAULT_CLIENT_INFO)
+
+    @property
+    def lookup(self):
+        return self._lookup
+
+    @property
+    def run_query(self):
+        return self._run_query
+
+    run_aggregation_query = _unsupported_rpc("run_aggregation_query")
+    begin_transaction = _unsupported_rpc("begin_transaction")
+    commit = _unsupported_rpc("commit")
+    rollback = _unsupported_rpc("rollback")
+    allocate_ids = _unsupported_rpc("allocate_ids")
+    reserve_ids = _unsupported_rpc("reserve_ids")
+
+    @property
+    def kind(self) -> str:
+        return "faulty"
+
+    def close(self):
+        pass
+
+    def put(self, entity):
+        self._entities[entity.key.flat_path] = entity
+
+    @property
+    def attempts(self) -> int:
+        return getattr(self._local, "attempts", 0)
+
+    def reset_attempts(self):
+        self._local.attempts = 0
+
+    def _inject(self, timeout):
+        self._local.attempts = self.attempts + 1
+        if self._random.random() < self._slow_rate:
+            if timeout is not None and self._slow_seconds > timeout:
+                time.sleep(timeout)
+                raise DeadlineExceeded("injected slow call")
+            time.sleep(self._slow_seconds)
+
+        if self._random.random() < self._error_rate:
+            raise ServiceUnavailable("injected error")
+
+    def _do_lookup(self, request, timeout=None, metadata=()):
+        self._inject(timeout)
+        response = datastore_pb2.LookupResponse()
+        for key_pb in request.keys:
+            key = helpers.key_from_protobuf(key_pb)
+            entity = self._entities.get(key.flat_path)
+            if entity is None:
+                response.missing.append({"entity": {"key": key_pb}})
+            else:
+                response.found.append({"entity": helpers.entity_to_protobuf(entity)})
+        return response
+
+    def _do_run_query(self, request, timeout=None, metadata=()):
+        self._inject(timeout)
+        kind = request.query.kind[0].name
+
+        filters = []
+        filter_pb = request.query.filter
+        if "composite_filter" in filter_pb:
+            filters = [
+                item.property_filter for item in filter_pb.composite_filter.filters
+            ]
+        elif "property_filter" in filter_pb:
+            filters = [filter_pb.property_filter]
+
+        results = []
+        for path, entity in self._entities.items():
+            if path[0] != kind:
+                continue
+            if all(
+                entity.get(item.property.name)
+                == helpers._get_value_from_value_pb(item.value._pb)
+                for item in filters
+            ):
+                results.append({"entity": helpers.entity_to_protobuf(entity)})
+
+        return datastore_pb2.RunQueryResponse(
+            batch={
+                "entity_result_type": query_pb2.EntityResult.ResultType.FULL,
+                "entity_results": results,
+                "more_results": query_pb2.QueryResultBatch.MoreResultsType.NO_MORE_RESULTS,
+            }
+        )
+
+
+class _CountingDatastoreClient(DatastoreClient):
+    """
+    gapic client recording how many transport attempts each call made
+    More than one means a library-level Retry ran inside our own attempt
+    """
+
+    max_attempts_per_call = 0
+
+    def _counted(self, method, *args, **kwargs):
+        transport = self._transport
+        start = transport.attempts
+        try:
+            return method(*args, **kwargs)
+        finally:
+            attempts = transport.attempts - start
+            if attempts > _CountingDatastoreClient.max_attempts_per_call:
+                _CountingDatastoreClient.max_attempts_per_call = attempts
+
+    def lookup(self, *args, **kwargs):
+        return self._counted(super().lookup, *args, **kwargs)
+
+    def run_query(self, *args, **kwargs):
+        return self._counted(super().run_query, *args, **kwargs)
+
+
+def make_faulty_client(transport: FaultyTransport) -> object:
+    """
+    A real datastore.Client whose RPCs go through the faulty transport
+    """
+    from google.cloud import datastore
+
+    client = datastore.Client(
+        project=PROJECT, credentials=AnonymousCredentials(), _use_grpc=True
+    )
+    client._datastore_api_internal = _CountingDatastoreClient(transport=transport)
+    return client
+
+
+class MemoryDatastoreClient:
+    """
+    Minimal in-memory stand-in supporting key lookups and puts
+    """
+
+    project = "fault-injection"
+
+    def __init__(self):
+        self._entities = {}
+
+    def key(self, *path):
+        from google.cloud.datastore import Key
+
+        return Key(*path, project=self.project)
+
+    def get(self, key, **kwargs):
+        return self._entities.get(key.flat_path)
+
+    def get_multi(self, keys, **kwargs):
+        return [
+            self._entities[k.flat_path] for k in keys if k.flat_path in self._entities
+        ]
+
+    def put(self, entity, **kwargs):
+        self._entities[entity.key.flat_path] = entity
+
+
+class FaultyDatastoreClient:
+    """
+    Wraps a client, delaying or failing a fraction of calls
+    Slow calls longer than the caller's timeout raise DeadlineExceeded
+    """
+
+    def __init__(self, inner, error_rate, slow_rate, slow_seconds, seed=None):
+        self._inner = inner
+        self._error_rate = error_rate
+        self._slow_rate = slow_rate
+        self._slow_seconds = slow_seconds
+        self._random = random.Random(seed)
+
+    def _inject(self, timeout):
+        if self._random.random() < self._slow_rate:
+            if timeout is not None and self._slow_seconds > timeout:
+                time.sleep(timeout)
+                raise DeadlineExceeded("injected slow call")
+            time.sleep(self._slow_seconds)
+
+        if self._random.random() < self._error_rate:
+            raise ServiceUnavailable("injected error")
+
+    def _wrap(self, method):
+        def call(*args, **kwargs):
+            self._inject(kwargs.get("timeout"))
+            return method(*args, **kwargs)
+
+        return call
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._inner, name)
+        if name in {"get", "get_multi", "put", "put_multi", "delete", "delete_multi"}:
+            return self._wrap(attribute)
+        return attribute
+
+
+def run(args) -> dict:
+    """
+    Seeds courses and users, then times course lookups and user-by-sub
+    queries under injected faults
+    """
+    import main
+    from utils.clients import configure_clients, new_entity
+    from utils.utils import get_course_by_id, get_user_by_sub
+
+    transport = FaultyTransport(
+        args.error_rate, args.slow_rate, args.slow_seconds, args.seed
+    )
+    client = make_faulty_client(transport)
+
+    for course_id in range(1, args.courses + 1):
+        course = new_entity(client.key("courses", course_id))
+        course.update({"subject": "CS", "number": course_id, "title": "Course"})
+        transport.put(course)
+
+        user = new_entity(client.key("users", course_id))
+        user.update({"sub": f"fault|{course_id}", "role": "student"})
+        transport.put(user)
+
+    configure_clients(datastore=client)
+
+    latencies, failures, max_attempts = [], 0, 0
+    for lookup in range(args.lookups):
+        entity_id = random.randint(1, args.courses)
+        with main.app.test_request_context("/"):
+            main.app.preprocess_request()
+            transport.reset_attempts()
+            start = time.perf_counter()
+            try:
+                if lookup % 2:
+                    get_user_by_sub(f"fault|{entity_id}")
+                else:
+                    get_course_by_id(entity_id)
+            except BackendUnavailable:
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+            max_attempts = max(max_attempts, transport.attempts)
+
+    latencies.sort()
+    return {
+        "lookups": args.lookups,
+        "unavailable": failures,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "max_ms": latencies[-1],
+        "max_rpc_attempts": max_attempts,
+        "max_attempts_per_gapic_call": _CountingDatastoreClient.max_attempts_per_call,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-seconds", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit non-zero if a lookup made more RPC attempts than our retries allow",
+    )
+    args = parser.parse_args()
+
+    result = run(args)
+    for name, value in result.items():
+        print(
+            f"{name}: {value:.1f}" if isinstance(value, float) else f"{name}: {value}"
+        )
+
+    # hedged duplicates run on the pool and aren't counted per lookup
+    if args.check and (
+        result["max_attempts_per_gapic_call"] > 1
+        or result["max_rpc_attempts"] > resilience.MAX_READ_ATTEMPTS
+    ):
+        print("library retries are nesting inside call_with_deadline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Rewrites legacy enrollment rows (auto-allocated ids) under deterministic
+"<course_id>:<student_id>" keys, dropping duplicates along the way.
+
+Run from the repository root:
+
+    python -m tools.migrate_enrollment --batch-size 500 [--dry-run]
+"""
+
+import argparse
+
+from utils.clients import get_datastore_client
+from utils.utils import delete_in_batches, new_enrollment, put_in_batches
+
+
+def migrate(batch_size: int, dry_run: bool = False) -> dict:
+    """
+    Migrates enrollment rows in batches, returns counts of what changed
+    """
+    client = get_datastore_client()
+    stats = {"scanned": 0, "written": 0, "deleted": 0}
+    seen = set()
+    cursor = None
+
+    while True:
+        query = client.query(kind="enrollment")
+        query_iterator = query.fetch(limit=batch_size, start_cursor=cursor)
+        page = list(next(query_iterator.pages))
+        cursor = query_iterator.next_page_token
+
+        new_rows, old_keys = [], []
+        for item in page:
+            stats["scanned"] += 1
+            if item.key.id is None:
+                # already keyed by (course_id, student_id)
+                continue
+
+            pair = (int(item["course_id"]), int(item["student_id"]))
+            if pair not in seen:
+                seen.add(pair)
+                new_rows.append(new_enrollment(*pair))
+            old_keys.append(item.key)
+
+        if not dry_run:
+            # pages can be larger than a commit's 500-mutation limit
+            put_in_batches(new_rows)
+            delete_in_batches(old_keys)
+
+        stats["written"] += len(new_rows)
+        stats["deleted"] += len(old_keys)
+
+        if not page or not cursor:
+            return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    stats = migrate(args.batch_size, args.dry_run)
+    print(
+        f"scanned={stats['scanned']} written={stats['written']} "
+        f"deleted={stats['deleted']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Seeds synthetic users, courses and enrollments for load tests, or removes
+them again. Seeded entities carry a `seeded` marker (users also get a
+`seed|` sub) and live above --id-offset. That id range is reserved first
+and seeding stops if it already holds entities, so real data isn't
+overwritten. Set DATASTORE_EMULATOR_HOST to target the local emulator.
+
+Run from the repository root:
+
+    python -m tools.seed seed --users 100000 --courses 20000 --enrollments 1000000
+    python -m tools.seed reset
+    python -m tools.seed reset --all --yes-wipe-all
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.clients import get_datastore_client, new_entity, property_filter
+from utils.utils import MAX_MUTATIONS, enrollment_key
+
+KINDS = ("users", "courses", "enrollment")
+SUBJECTS = ("CS", "MATH", "PH", "BIO", "CH", "ECE", "ME", "HST", "WR", "ART")
+TERMS = ("fall-24", "winter-25", "spring-25", "summer-25", "fall-25")
+INSTRUCTOR_SHARE = 0.05
+# popularity skew: course and subject weights follow 1 / rank**ZIPF_EXPONENT
+ZIPF_EXPONENT = 1.1
+# seeded ids start above this; the range is reserved and checked before
+# seeding, Datastore's scattered auto ids can land anywhere
+SEED_ID_OFFSET = 1_000_000_000
+SEED_MARKER = "seeded"
+
+
+def _zipf_weights(count: int) -> list[float]:
+    return [1 / (rank**ZIPF_EXPONENT) for rank in range(1, count + 1)]
+
+
+class BatchWriter:
+    """
+    Writes entities with put_multi (or deletes keys with delete_multi)
+    from a thread pool, keeping a bounded number of batches in flight
+    """
+
+    def __init__(self, method, batch_size: int, workers: int):
+        self._method = method
+        # each batch is one commit, capped at Datastore's mutation limit
+        self._batch_size = min(batch_size, MAX_MUTATIONS)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._max_pending = workers * 2
+        self._pending = set()
+        self._batch = []
+        self.count = 0
+
+    def add(self, item):
+        self._batch.append(item)
+        if len(self._batch) == self._batch_size:
+            self._submit()
+
+    def _submit(self):
+        if not self._batch:
+            return
+        if len(self._pending) >= self._max_pending:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+
+        self._pending.add(self._executor.submit(self._method, self._batch))
+        self.count += len(self._batch)
+        self._batch = []
+
+    def close(self):
+        self._submit()
+        for future in self._pending:
+            future.result()
+        self._executor.shutdown()
+
+
+def _claim_id_range(client, kind: str, first: int, count: int):
+    """
+    Reserves ids [first, first + count) of kind so Datastore won't
+    auto-allocate them, and refuses to seed if any are already in use
+    """
+    for start in range(first, first + count, MAX_MUTATIONS):
+        size = min(MAX_MUTATIONS, first + count - start)
+        client.reserve_ids_sequential(client.key(kind, start), size)
+
+    query = client.query(kind=kind)
+    query.add_filter(filter=property_filter("__key__", ">=", client.key(kind, first)))
+    query.add_filter(
+        filter=property_filter("__key__", "<", client.key(kind, first + count))
+    )
+    query.keys_only()
+    if list(query.fetch(limit=1)):
+        sys.exit(
+            f"{kind} ids {first}..{first + count - 1} are already in use, "
+            "pick another --id-offset"
+        )
+
+
+def seed(args) -> dict:
+    """
+    Generates users, courses and enrollments with skewed popularity
+    """
+    client = get_datastore_client()
+    rng = random.Random(args.seed)
+    offset = args.id_offset
+    instructors = max(1, int(args.users * INSTRUCTOR_SHARE))
+    admin = offset + 1
+    first_student = admin + 1 + instructors
+    last_user = offset + args.users + 1
+
+    _claim_id_range(client, "users", admin, args.users)
+    _claim_id_range(client, "courses", offset + 1, args.courses)
+
+    # the first user is the admin, then instructors, then students
+    writer = BatchWriter(client.put_multi, args.batch_size, args.workers)
+    for user_id in range(admin, last_user):
+        if user_id == admin:
+            role = "admin"
+        elif user_id < first_student:
+            role = "instructor"
+        else:
+            role = "student"
+        user = new_entity(client.key("users", user_id))
+        user.update(
+            {
+                "sub": f"seed|{user_id}",
+                "role": role,
+                "avatar": None,
+                SEED_MARKER: True,
+            }
+        )
+        writer.add(user)
+
+    subject_weights = list(itertools.accumulate(_zipf_weights(len(SUBJECTS))))
+    instructor_ids = range(admin + 1, first_student)
+    instructor_weights = list(itertools.accumulate(_zipf_weights(instructors)))
+    course_ids = range(offset + 1, offset + args.courses + 1)
+    for course_id in course_ids:
+        course = new_entity(client.key("courses", course_id))
+        course.update(
+            {
+                "subject": rng.choices(SUBJECTS, cum_weights=subject_weights)[0],
+                "number": rng.randint(100, 599),
+                "title": f"Course {course_id}",
+                "term": rng.choice(TERMS),
+                "instructor_id": rng.choices(
+                    instructor_ids, cum_weights=instructor_weights
+                )[0],
+                SEED_MARKER: True,
+            }
+        )
+        writer.add(course)
+
+    # students take a varying number of courses, popular courses fill up
+    students = max(1, last_user - first_student)
+    mean = args.enrollments / students
+    cumulative = list(itertools.accumulate(_zipf_weights(args.courses)))
+    enrollments = 0
+    for student_id in range(first_student, last_user):
+        if enrollments >= args.enrollments:
+            break
+        wanted = max(0, min(args.courses, round(rng.gauss(mean, mean / 2))))
+        wanted = min(wanted, args.enrollments - enrollments)
+        chosen = set()
+        for _ in range(4):
+            missing = wanted - len(chosen)
+            if not missing:
+                break
+            chosen.update(rng.choices(course_ids, cum_weights=cumulative, k=missing))
+        for course_id in chosen:
+            enrollment = new_entity(enrollment_key(course_id, student_id))
+            enrollment.update(
+                {"student_id": student_id, "course_id": course_id, SEED_MARKER: True}
+            )
+            writer.add(enrollment)
+        enrollments += len(chosen)
+
+    writer.close()
+    return {"entities": writer.count, "enrollments": enrollments}
+
+
+def reset(args) -> dict:
+    """
+    Deletes seeded entities of the given kinds with keys-only queries,
+    or every entity of those kinds with --all
+    """
+    if (
+        args.all
+        and not args.yes_wipe_all
+        and not os.environ.get("DATASTORE_EMULATOR_HOST")
+    ):
+        sys.exit(
+            "reset --all deletes real data too; point DATASTORE_EMULATOR_HOST "
+            "at the emulator or pass --yes-wipe-all"
+        )
+
+    client = get_datastore_client()
+    writer = BatchWriter(client.delete_multi, args.batch_size, args.workers)
+
+    for kind in args.kinds:
+        query = client.query(kind=kind)
+        if not args.all:
+            query.add_filter(filter=property_filter(SEED_MARKER, "=", True))
+        query.keys_only()
+        for item in query.fetch():
+            writer.add(item.key)
+
+    writer.close()
+    return {"deleted": writer.count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed")
+    seed_parser.add_argument("--users", type=int, default=1000)
+    seed_parser.add_argument("--courses", type=int, default=200)
+    seed_parser.add_argument("--enrollments", type=int, default=10000)
+    seed_parser.add_argument("--seed", type=int, default=None)
+    seed_parser.add_argument("--id-offset", type=int, default=SEED_ID_OFFSET)
+
+    reset_parser = commands.add_parser("reset")
+    reset_parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS)
+    reset_parser.add_argument("--all", action="store_true")
+    reset_parser.add_argument("--yes-wipe-all", action="store_true")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = seed(args) if args.command == "seed" else reset(args)
+    elapsed = time.perf_counter() - start
+
+    summary = " ".join(f"{name}={value}" for name, value in result.items())
+    print(f"{summary} seconds={elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 from flask import Blueprint, request, jsonify, send_file
-from google.cloud import datastore, storage
 
 from utils.auth import AuthError, verify_jwt
+from utils.clients import LazyDatastoreClient, get_storage_client
 from utils.errors import get_error_message
+from utils.metrics import backend_timer
+from utils.resilience import BackendUnavailable
+from utils.serializers import (
+    USER_FIELDS,
+    parse_fields,
+    resource_url_prefix,
+    serialize_user,
+)
 from utils.utils import (
     verify_user_id,
     verify_admin,
@@ -12,7 +20,6 @@ from utils.utils import (
     get_user_by_id,
 )
 
-import requests
 import io
 
 CLIENT_ID = "****"
@@ -20,10 +27,12 @@ CLIENT_SECRET = "****"
 DOMAIN = "****"
 PHOTO_BUCKET = "****"
 
-client = datastore.Client()
+client = LazyDatastoreClient()
 
 bp = Blueprint("users", __name__)
 
+USER_LIST_FIELDS = ("id", "role", "sub")
+
 
 @bp.errorhandler(AuthError)
 def handle_auth_error(ex):
@@ -37,6 +46,8 @@ def login():
     """
     Log in for a pre-registered user, verifies that a user exists
     """
+    import requests
+
     content = request.get_json()
     if "username" not in content or "password" not in content:
         return get_error_message(400)
@@ -52,7 +63,8 @@ def login():
     }
     headers = {"content-type": "application/json"}
     url = "https://" + DOMAIN + "/oauth/token"
-    r = requests.post(url, json=body, headers=headers)
+    with backend_timer("auth0", "token"):
+        r = requests.post(url, json=body, headers=headers)
 
     if "id_token" not in r.json():
         return get_error_message(401)
@@ -66,6 +78,7 @@ def login():
 def get_users():
     """
     Admin API to retrieve all pre-populated users
+    ?fields=id,role limits the returned properties
     """
     try:
         payload = verify_jwt(request)
@@ -73,16 +86,25 @@ def get_users():
         if not verify_admin(payload["sub"]):
             return get_error_message(403)
 
+        try:
+            fields = parse_fields(request.args.get("fields"), USER_LIST_FIELDS)
+        except ValueError:
+            return get_error_message(400)
+
         query = client.query(kind="users")
+        if fields is not None:
+            # role, sub and (role, sub) are all covered by indexes
+            projection = sorted(fields - {"id"})
+            if projection:
+                query.projection = projection
+            else:
+                query.keys_only()
         results = list(query.fetch())
 
-        return_array = []
+        return [serialize_user(item, fields=fields) for item in results]
 
-        for item in results:
-            new_resource = {"id": item.key.id, "role": item["role"], "sub": item["sub"]}
-            return_array.append(new_resource)
-
-        return return_array
+    except BackendUnavailable:
+        return get_error_message(503)
 
     except:
         return get_error_message(401)
@@ -93,50 +115,41 @@ def get_user(user_id: str):
     """
     Retrieve user by id
     If student or instructor -> courses: [url, url] | []
+    ?fields=id,courses limits the returned properties, course lists
+    are only looked up when requested
     """
     try:
         payload = verify_jwt(request)
         sub = payload["sub"]
 
-        if verify_admin(sub):
-            user = get_user_by_id(user_id)
+        try:
+            fields = parse_fields(request.args.get("fields"), USER_FIELDS)
+        except ValueError:
+            return get_error_message(400)
 
-            if user["avatar"]:
-                avatar_url = generate_url("users", user_id, True)
-                return {
-                    "id": user.key.id,
-                    "role": user["role"],
-                    "sub": user["sub"],
-                    "avatar_url": avatar_url,
-                }
+        avatar_prefix = resource_url_prefix("users")
 
-            return {"id": user.key.id, "role": user["role"], "sub": user["sub"]}
+        if verify_admin(sub):
+            user = get_user_by_id(user_id)
+            return serialize_user(user, avatar_prefix, fields=fields)
 
         user = verify_user_id(sub, user_id)
         if not user:
             return get_error_message(403)
 
-        if user["role"] == "instructor":
+        if fields is not None and "courses" not in fields:
+            courses = None
+
+        elif user["role"] == "instructor":
             courses = generate_instructor_courses(user_id)
 
-        if user["role"] == "student":
+        elif user["role"] == "student":
             courses = generate_student_courses(user_id)
 
-        if user["avatar"]:
-            avatar_url = generate_url("users", user_id, True)
-            return {
-                "id": user.key.id,
-                "role": user["role"],
-                "sub": user["sub"],
-                "avatar_url": avatar_url,
-                "courses": courses,
-            }
-        return {
-            "id": user.key.id,
-            "role": user["role"],
-            "sub": user["sub"],
-            "courses": courses,
-        }
+        return serialize_user(user, avatar_prefix, courses, fields)
+
+    except BackendUnavailable:
+        return get_error_message(503)
 
     except:
         return get_error_message(401)
@@ -160,11 +173,12 @@ def post_user_avatar(user_id: int):
 
         file_obj = request.files["file"]
         filename = f"{user_id}_{file_obj.filename}"
-        client_storage = storage.Client()
-        bucket = client_storage.get_bucket(PHOTO_BUCKET)
-        blob = bucket.blob(filename)
-        file_obj.seek(0)
-        blob.upload_from_file(file_obj)
+        client_storage = get_storage_client()
+        with backend_timer("gcs", "upload"):
+            bucket = client_storage.get_bucket(PHOTO_BUCKET)
+            blob = bucket.blob(filename)
+            file_obj.seek(0)
+            blob.upload_from_file(file_obj)
 
         user.update({"avatar": filename})
         client.put(user)
@@ -172,6 +186,9 @@ def post_user_avatar(user_id: int):
         avatar_url = generate_url("users", user_id, True)
         return {"avatar_url": avatar_url}
 
+    except BackendUnavailable:
+        return get_error_message(503)
+
     except:
         return get_error_message(401)
 
@@ -194,16 +211,19 @@ def get_user_avatar(user_id: int):
         if not file_name or (len(file_name) == 0):
             return get_error_message(404)
 
-        client_storage = storage.Client()
-        bucket = client_storage.get_bucket(PHOTO_BUCKET)
-        blob = bucket.blob(file_name)
-
+        client_storage = get_storage_client()
         file_obj = io.BytesIO()
-        blob.download_to_file(file_obj)
+        with backend_timer("gcs", "download"):
+            bucket = client_storage.get_bucket(PHOTO_BUCKET)
+            blob = bucket.blob(file_name)
+            blob.download_to_file(file_obj)
         file_obj.seek(0)
 
         return send_file(file_obj, mimetype="image/x-png", download_name=file_name)
 
+    except BackendUnavailable:
+        return get_error_message(503)
+
     except:
         return get_error_message(401)
 
@@ -226,15 +246,19 @@ def delete_user_avatar(user_id: str):
         if not file_name or (len(file_name) == 0):
             return get_error_message(404)
 
-        client_storage = storage.Client()
-        bucket = client_storage.get_bucket(PHOTO_BUCKET)
-        blob = bucket.blob(file_name)
-        blob.delete()
+        client_storage = get_storage_client()
+        with backend_timer("gcs", "delete"):
+            bucket = client_storage.get_bucket(PHOTO_BUCKET)
+            blob = bucket.blob(file_name)
+            blob.delete()
 
         user.update({"avatar": None})
         client.put(user)
 
         return "", 204
 
+    except BackendUnavailable:
+        return get_error_message(503)
+
     except:
         return get_error_message(401)
@@ -1,10 +1,26 @@
 from six.moves.urllib.request import urlopen
-from jose import jwt
 import json
+import time
+
+from flask import current_app, has_app_context
+
+from utils.metrics import backend_timer, record_cache
+from utils.singleflight import SingleFlight
 
 CLIENT_ID = "****"
 DOMAIN = "****"
 ALGORITHMS = ["****"]
+JWKS_TTL_SECONDS = 600
+JWKS_MIN_REFRESH_SECONDS = 60
+# WSGI environ key for tokens already verified in this request,
+# shared with sub-requests of POST /batch
+VERIFIED_TOKENS_KEY = "tarpaulin.verified_tokens"
+
+JWKS_URL = "https://" + DOMAIN + "/.well-known/jwks.json"
+
+_jwks_cache = {"jwks": None, "fetched_at": 0.0}
+# requests arriving while the JWKS is being fetched wait for that fetch
+_jwks_fetches = SingleFlight("jwks", share=lambda jwks: jwks)
 
 # This code is adapted from https://auth0.com/docs/quickstart/backend/python/01-authorization?_ga=2.46956069.349333901.1589042886-466012638.1589042885#create-the-jwt-validation-decorator
 
@@ -15,8 +31,60 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+def get_jwks(refresh: bool = False) -> dict:
+    """
+    Returns the IdP's JWKS document, cached in-process for the app's
+    JWKS_TTL_SECONDS (the module default outside an app context)
+    refresh forces a refetch, at most once every JWKS_MIN_REFRESH_SECONDS
+    """
+    jwks = _jwks_cache["jwks"]
+    age = time.monotonic() - _jwks_cache["fetched_at"]
+    max_age = JWKS_MIN_REFRESH_SECONDS if refresh else _jwks_ttl()
+    if jwks is not None and age < max_age:
+        record_cache("jwks", hit=True)
+        return jwks
+
+    record_cache("jwks", hit=False)
+    return _jwks_fetches.do(JWKS_URL, _fetch_jwks)
+
+
+def _jwks_ttl() -> float:
+    if not has_app_context():
+        return JWKS_TTL_SECONDS
+    return current_app.config.get("JWKS_TTL_SECONDS", JWKS_TTL_SECONDS)
+
+
+def _fetch_jwks() -> dict:
+    with backend_timer("jwks", "fetch"):
+        jsonurl = urlopen(JWKS_URL)
+        jwks = json.loads(jsonurl.read())
+    _jwks_cache["jwks"] = jwks
+    _jwks_cache["fetched_at"] = time.monotonic()
+
+    return jwks
+
+
+def find_rsa_key(jwks: dict, kid: str) -> dict:
+    """
+    Returns the RSA key matching kid, or an empty dict
+    """
+    rsa_key = {}
+    for key in jwks["keys"]:
+        if key["kid"] == kid:
+            rsa_key = {
+                "kty": key["kty"],
+                "kid": key["kid"],
+                "use": key["use"],
+                "n": key["n"],
+                "e": key["e"],
+            }
+    return rsa_key
+
+
 # Verify the JWT in the request's Authorization header
 def verify_jwt(request):
+    from jose import jwt
+
     if "Authorization" in request.headers:
         auth_header = request.headers["Authorization"].split()
         token = auth_header[1]
@@ -29,8 +97,11 @@ def verify_jwt(request):
             401,
         )
 
-    jsonurl = urlopen("https://" + DOMAIN + "/.well-known/jwks.json")
-    jwks = json.loads(jsonurl.read())
+    verified = request.environ.setdefault(VERIFIED_TOKENS_KEY, {})
+    if token in verified:
+        return verified[token]
+
+    jwks = get_jwks()
     try:
         unverified_header = jwt.get_unverified_header(token)
     except jwt.JWTError:
@@ -51,16 +122,10 @@ def verify_jwt(request):
             },
             401,
         )
-    rsa_key = {}
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"],
-            }
+    rsa_key = find_rsa_key(jwks, unverified_header["kid"])
+    if not rsa_key:
+        # signing keys may have rotated since the JWKS was cached
+        rsa_key = find_rsa_key(get_jwks(refresh=True), unverified_header["kid"])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -92,6 +157,7 @@ def verify_jwt(request):
                 401,
             )
 
+        verified[token] = payload
         return payload
     else:
         raise AuthError(
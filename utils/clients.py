@@ -0,0 +1,216 @@
+import threading
+
+from flask import current_app, has_app_context
+
+from utils.metrics import backend_timer
+from utils.resilience import call_with_deadline, current_deadline, hedged
+
+# Backend clients are built on first use so importing the app stays cheap
+# and cold starts don't pay for gRPC/HTTP setup before the first request.
+# An app can carry its own pre-built clients in app.extensions["clients"]
+# (see create_app), those take precedence inside its app context
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def _get_or_create(name: str, factory) -> object:
+    """
+    Returns the cached client for name, constructing it once
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+def _new_datastore_client() -> object:
+    from google.cloud import datastore
+
+    return datastore.Client()
+
+
+def _new_storage_client() -> object:
+    from google.cloud import storage
+
+    return storage.Client()
+
+
+def _app_client(name: str) -> object:
+    """
+    Returns the current app's pre-built client for name, if it has one
+    """
+    if not has_app_context():
+        return None
+    return current_app.extensions.get("clients", {}).get(name)
+
+
+def get_datastore_client() -> object:
+    """
+    The current app's Datastore client, or the shared one
+    """
+    client = _app_client("datastore")
+    if client is not None:
+        return client
+    return _get_or_create("datastore", _new_datastore_client)
+
+
+def get_storage_client() -> object:
+    """
+    The current app's Cloud Storage client, or the shared one
+    """
+    client = _app_client("storage")
+    if client is not None:
+        return client
+    return _get_or_create("storage", _new_storage_client)
+
+
+def configure_clients(datastore: object = None, storage: object = None):
+    """
+    Installs pre-built clients (e.g. pointed at the emulator)
+    Clients that aren't given are still built lazily
+    """
+    with _lock:
+        if datastore is not None:
+            _clients["datastore"] = datastore
+        if storage is not None:
+            _clients["storage"] = storage
+
+
+_DATASTORE_READS = {"get", "get_multi"}
+_DATASTORE_WRITES = {"put", "put_multi", "delete", "delete_multi"}
+
+
+def _datastore_call(operation: str, method):
+    idempotent = operation in _DATASTORE_READS
+
+    def call(*args, **kwargs):
+        deadline = current_deadline()
+        with backend_timer("datastore", operation):
+            return call_with_deadline(
+                "datastore",
+                method,
+                *args,
+                deadline=deadline,
+                idempotent=idempotent,
+                **kwargs,
+            )
+
+    return call
+
+
+class _TimedQueryIterator:
+    """
+    Wraps a query iterator so each page fetch is timed and runs through
+    call_with_deadline: pages are idempotent reads, so transient errors are
+    retried and exhausted retries raise BackendUnavailable
+    """
+
+    def __init__(self, iterator, deadline: float):
+        self._iterator = iterator
+        self._deadline = deadline
+
+    def _next_page(self, timeout: float, retry: object):
+        # the iterator only advances its cursor after a successful RPC,
+        # so a failed page can be requested again
+        self._iterator._timeout = timeout
+        self._iterator._retry = retry
+        return self._iterator._next_page()
+
+    @property
+    def pages(self):
+        while True:
+            with backend_timer("datastore", "query"):
+                page = call_with_deadline(
+                    "datastore",
+                    self._next_page,
+                    deadline=self._deadline,
+                    idempotent=True,
+                )
+            if page is None:
+                return
+            self._iterator.page_number += 1
+            self._iterator.num_results += page.num_items
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+    def __getattr__(self, name: str):
+        return getattr(self._iterator, name)
+
+
+class _TimedQuery:
+    """
+    Wraps a datastore query so fetches are timed and retried
+    """
+
+    def __init__(self, query):
+        object.__setattr__(self, "_query", query)
+
+    def fetch(self, *args, **kwargs):
+        deadline = current_deadline()
+        return _TimedQueryIterator(self._query.fetch(*args, **kwargs), deadline)
+
+    def __getattr__(self, name: str):
+        return getattr(self._query, name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._query, name, value)
+
+
+class LazyDatastoreClient:
+    """
+    Module level stand-in for datastore.Client()
+    Forwards attribute access to the shared client, building it on first use
+    RPCs are timed into the backend_call_duration_seconds metric and run
+    within the request's deadline budget, reads are retried
+    """
+
+    def get_hedged(self, key: object) -> object:
+        """
+        Key lookup that sends a duplicate read if the first is slow
+        """
+        client = get_datastore_client()
+        deadline = current_deadline()
+
+        def lookup():
+            return call_with_deadline(
+                "datastore", client.get, key, deadline=deadline, idempotent=True
+            )
+
+        with backend_timer("datastore", "get"):
+            return hedged("datastore", lookup, deadline)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(get_datastore_client(), name)
+
+        if name in _DATASTORE_READS or name in _DATASTORE_WRITES:
+            return _datastore_call(name, attribute)
+        if name == "query":
+            return lambda *args, **kwargs: _TimedQuery(attribute(*args, **kwargs))
+
+        return attribute
+
+
+def property_filter(property_name: str, operator: str, value) -> object:
+    """
+    Builds a Datastore PropertyFilter without importing datastore at load time
+    """
+    from google.cloud.datastore.query import PropertyFilter
+
+    return PropertyFilter(property_name, operator, value)
+
+
+def new_entity(key: object) -> object:
+    """
+    Builds a Datastore Entity without importing datastore at load time
+    """
+    from google.cloud.datastore import Entity
+
+    return Entity(key=key)
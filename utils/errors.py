@@ -11,6 +11,7 @@ def get_error_message(status_code: int, entity=None) -> str:
         403: "You don't have permission on this resource",
         404: "Not found",
         409: "Enrollment data is invalid",
+        503: "Service temporarily unavailable",
     }
 
     if status_code not in errors:
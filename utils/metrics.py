@@ -0,0 +1,206 @@
+import bisect
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+# Prometheus style metrics kept in per-thread shards: each worker thread only
+# writes its own dicts, so the request path takes no locks. Shards are
+# summed when /metrics is scraped. Shards are per process: under several
+# gunicorn workers a scrape only sees the worker that served it, so every
+# series carries a worker="<pid>" label, aggregate with sum without (worker).
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests by route and status"),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency by route"),
+    "backend_call_duration_seconds": (
+        "histogram",
+        "Backend call latency (datastore, gcs, jwks, auth0)",
+    ),
+    "backend_errors_total": ("counter", "Backend calls that raised"),
+    "backend_retries_total": ("counter", "Backend calls retried after an error"),
+    "backend_hedges_total": ("counter", "Duplicate reads sent for slow lookups"),
+    "cache_requests_total": ("counter", "In-process cache lookups by result"),
+    "singleflight_calls_total": (
+        "counter",
+        "Coalesced lookups, result=collapsed calls shared another's backend call",
+    ),
+}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _shard() -> dict:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = {"counters": {}, "histograms": {}}
+        _local.shard = shard
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def inc_counter(name: str, labels: tuple, amount: int = 1):
+    """
+    Increments a counter, labels is a tuple of (label, value) pairs
+    """
+    counters = _shard()["counters"]
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name: str, labels: tuple, seconds: float):
+    """
+    Records a latency sample in a histogram
+    """
+    histograms = _shard()["histograms"]
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        # [per-bucket counts..., +Inf count, sum]
+        histogram = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histograms[key] = histogram
+
+    histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram[-1] += seconds
+
+
+@contextmanager
+def backend_timer(backend: str, operation: str):
+    """
+    Times a backend call, counting calls that raise
+    """
+    labels = (("backend", backend), ("operation", operation))
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc_counter("backend_errors_total", labels)
+        raise
+    finally:
+        observe("backend_call_duration_seconds", labels, time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    """
+    Counts an in-process cache lookup as a hit or miss
+    """
+    inc_counter(
+        "cache_requests_total", (("cache", cache), ("result", "hit" if hit else "miss"))
+    )
+
+
+def _collect() -> tuple[dict, dict]:
+    counters, histograms = {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+
+    for shard in shards:
+        for key, value in dict(shard["counters"]).items():
+            counters[key] = counters.get(key, 0) + value
+        for key, values in dict(shard["histograms"]).items():
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(list(values)):
+                total[i] += value
+
+    return counters, histograms
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def render() -> str:
+    """
+    Renders all metrics in the Prometheus text exposition format
+    """
+    counters, histograms = _collect()
+    # read at render time, workers are forked after the app is loaded
+    worker = (("worker", str(os.getpid())),)
+    lines = []
+
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(worker + labels)} {value}")
+            continue
+
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            labels = worker + labels
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), values[:-1]):
+                cumulative += count
+                le = labels + (("le", bound),)
+                lines.append(f"{name}_bucket{_format_labels(le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    route = (
+        ("blueprint", request.blueprint or ""),
+        ("method", request.method),
+        ("route", rule),
+    )
+    inc_counter("http_requests_total", route + (("status", str(response.status_code)),))
+    observe("http_request_duration_seconds", route, time.perf_counter() - start)
+
+    return response
+
+
+def get_metrics():
+    """
+    Prometheus scrape endpoint
+    Requires "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set
+    """
+    if METRICS_TOKEN:
+        expected = f"Bearer {METRICS_TOKEN}"
+        provided = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(provided, expected):
+            return "", 401
+
+    return render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+def init_metrics(app):
+    """
+    Registers request timing hooks and the /metrics endpoint
+    """
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", view_func=get_metrics, methods=["GET"])
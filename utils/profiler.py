@@ -0,0 +1,203 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+from flask import g, request
+
+from utils.auth import verify_jwt
+from utils.errors import get_error_message
+from utils.resilience import BackendUnavailable
+from utils.utils import verify_admin
+
+# Profiling is off unless a sample rate or a profiling token is configured
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_TOP_N = 25
+# seconds between stack samples of profiled request threads
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+
+_stats_lock = threading.Lock()
+_route_stats = {}
+
+# cProfile (sys.monitoring on 3.12+) hooks the whole interpreter, so one
+# active profile would also record every other thread's requests. Instead a
+# background thread samples the stacks of the threads serving profiled
+# requests only, via sys._current_frames(). Maps thread ident -> samples.
+_profiled = {}
+_profiled_lock = threading.Lock()
+_profiled_event = threading.Event()
+_sampler = None
+
+
+def _should_profile() -> bool:
+    """
+    Samples requests at PROFILE_SAMPLE_RATE, or when the token header matches
+    """
+    token = request.headers.get(PROFILE_HEADER)
+    if PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _route_name() -> str:
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    return f"{request.method} {rule}"
+
+
+def _new_samples() -> dict:
+    # seconds attributed to each (filename, line, function) while it was
+    # running (self) or anywhere on the stack (cumulative)
+    return {"self": {}, "cumulative": {}}
+
+
+def _record_stack(samples: dict, frame, seconds: float):
+    own = samples["self"]
+    cumulative = samples["cumulative"]
+
+    code = frame.f_code
+    leaf = (code.co_filename, code.co_firstlineno, code.co_name)
+    own[leaf] = own.get(leaf, 0.0) + seconds
+
+    seen = set()
+    while frame is not None:
+        code = frame.f_code
+        function = (code.co_filename, code.co_firstlineno, code.co_name)
+        # recursive functions only count once per sample
+        if function not in seen:
+            seen.add(function)
+            cumulative[function] = cumulative.get(function, 0.0) + seconds
+        frame = frame.f_back
+
+
+def _sample_forever():
+    last = time.perf_counter()
+    while True:
+        if not _profiled_event.wait(timeout=60):
+            continue
+        time.sleep(PROFILE_INTERVAL)
+
+        now = time.perf_counter()
+        # the gap can exceed PROFILE_INTERVAL when the GIL is busy, so
+        # each sample is weighted by the time actually elapsed
+        elapsed = min(now - last, PROFILE_INTERVAL * 10)
+        last = now
+
+        with _profiled_lock:
+            if not _profiled:
+                _profiled_event.clear()
+                continue
+            frames = sys._current_frames()
+            for ident, samples in _profiled.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    _record_stack(samples, frame, elapsed)
+
+
+def _ensure_sampler():
+    global _sampler
+    with _profiled_lock:
+        if _sampler is None or not _sampler.is_alive():
+            # started lazily, threads don't survive gunicorn's fork
+            _sampler = threading.Thread(
+                target=_sample_forever, name="profile-sampler", daemon=True
+            )
+            _sampler.start()
+
+
+def _start_profile():
+    if not _should_profile():
+        return
+
+    _ensure_sampler()
+    g.profile_thread = threading.get_ident()
+    with _profiled_lock:
+        _profiled[g.profile_thread] = _new_samples()
+    _profiled_event.set()
+
+
+def _stop_profile(exc=None):
+    ident = g.pop("profile_thread", None)
+    if ident is None:
+        return
+
+    with _profiled_lock:
+        samples = _profiled.pop(ident, None)
+    if samples is None:
+        return
+
+    route = _route_name()
+    with _stats_lock:
+        stats = _route_stats.setdefault(route, _new_samples())
+        for kind in ("self", "cumulative"):
+            totals = stats[kind]
+            for function, seconds in samples[kind].items():
+                totals[function] = totals.get(function, 0.0) + seconds
+
+
+def top_functions(route: str = None, limit: int = PROFILE_TOP_N) -> dict:
+    """
+    Returns the functions with the most sampled cumulative time
+    for each profiled route
+    """
+    with _stats_lock:
+        routes = {
+            name: stats
+            for name, stats in _route_stats.items()
+            if route is None or name == route
+        }
+
+        report = {}
+        for name, stats in routes.items():
+            own = stats["self"]
+            rows = sorted(
+                stats["cumulative"].items(), key=lambda row: row[1], reverse=True
+            )
+            report[name] = [
+                {
+                    "function": "{}:{}({})".format(*function),
+                    "tottime_ms": round(own.get(function, 0.0) * 1000, 3),
+                    "cumtime_ms": round(cumtime * 1000, 3),
+                }
+                for function, cumtime in rows[:limit]
+            ]
+
+    return report
+
+
+def get_profile():
+    """
+    Admin API to read aggregated profiles, ?route=GET /courses&limit=10
+    """
+    try:
+        payload = verify_jwt(request)
+
+        if not verify_admin(payload["sub"]):
+            return get_error_message(403)
+
+        limit = int(request.args.get("limit", PROFILE_TOP_N))
+        return top_functions(request.args.get("route"), limit)
+
+    except BackendUnavailable:
+        return get_error_message(503)
+
+    except:
+        return get_error_message(401)
+
+
+def init_profiler(app):
+    """
+    Registers the sampling hooks and the admin profile endpoint
+    Hooks are only installed when profiling is configured
+    """
+    app.add_url_rule("/admin/profile", view_func=get_profile, methods=["GET"])
+
+    if PROFILE_SAMPLE_RATE <= 0 and not PROFILE_TOKEN:
+        return
+
+    app.before_request(_start_profile)
+    app.teardown_request(_stop_profile)
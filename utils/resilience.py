@@ -0,0 +1,186 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flask import g, has_request_context, request
+
+from utils.errors import get_error_message
+from utils.metrics import inc_counter
+
+# Per-request deadline budget shared by every Datastore call in the request
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "10"))
+# Upper bound for a single RPC attempt
+CALL_TIMEOUT_SECONDS = float(os.environ.get("DATASTORE_CALL_TIMEOUT", "3"))
+MAX_READ_ATTEMPTS = int(os.environ.get("DATASTORE_READ_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = 0.05
+# Send a duplicate key lookup when the first hasn't answered in this long,
+# 0 disables hedging
+HEDGE_AFTER_SECONDS = float(os.environ.get("DATASTORE_HEDGE_AFTER", "0"))
+# Hedged lookups run their primary read on the hedge pool too. It is sized
+# for every thread that can issue one, gunicorn request threads plus the
+# /batch pool (batch.BATCH_POOL_SIZE), so primaries never queue...
+HEDGE_CALLER_THREADS = int(os.environ.get("GUNICORN_THREADS", "8")) + 32
+# ...plus a few threads for duplicates; when those are busy no hedge is sent,
+# so hedging backs off instead of adding load when the backend is saturated
+MAX_HEDGES_IN_FLIGHT = int(os.environ.get("DATASTORE_MAX_HEDGES", "4"))
+# WSGI environ key carrying a parent request's deadline into sub-requests
+# (POST /batch), so they spend the parent's budget instead of a fresh one
+DEADLINE_KEY = "tarpaulin.deadline"
+
+_TRANSIENT_ERRORS = {
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+    "Aborted",
+    "RetryError",
+}
+
+_executor_lock = threading.Lock()
+_executor = None
+_hedge_slots = threading.BoundedSemaphore(MAX_HEDGES_IN_FLIGHT)
+_no_retry = None
+
+
+class BackendUnavailable(Exception):
+    """
+    A backend call ran out of deadline budget or retries
+    """
+
+
+def start_deadline():
+    """
+    Starts the deadline budget for the current request,
+    sub-requests inherit their parent's deadline
+    """
+    inherited = request.environ.get(DEADLINE_KEY)
+    if inherited is not None:
+        g.deadline = inherited
+    else:
+        g.deadline = time.monotonic() + REQUEST_DEADLINE_SECONDS
+
+
+def current_deadline() -> float:
+    """
+    Monotonic deadline of the current request, or a fresh budget
+    outside of a request
+    """
+    if has_request_context() and "deadline" in g:
+        return g.deadline
+    return time.monotonic() + REQUEST_DEADLINE_SECONDS
+
+
+def call_timeout(deadline: float) -> float:
+    """
+    Timeout for the next attempt, capped by what's left of the budget
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise BackendUnavailable("request deadline exceeded")
+    return min(CALL_TIMEOUT_SECONDS, remaining)
+
+
+def is_transient(ex: Exception) -> bool:
+    """
+    Checks for errors worth retrying (google.api_core exception names)
+    """
+    return type(ex).__name__ in _TRANSIENT_ERRORS or isinstance(ex, TimeoutError)
+
+
+def no_retry() -> object:
+    """
+    A google.api_core Retry that never retries
+    Passing retry=None to the datastore client falls back to the gapic
+    default Retry (60s deadline), which would nest inside our attempts
+    """
+    global _no_retry
+    if _no_retry is None:
+        from google.api_core.retry import Retry
+
+        _no_retry = Retry(predicate=lambda ex: False)
+    return _no_retry
+
+
+def call_with_deadline(
+    backend: str, method, *args, deadline: float, idempotent: bool, **kwargs
+):
+    """
+    Calls a client method with a per-attempt timeout
+    Idempotent calls are retried on transient errors with full jitter backoff
+    """
+    attempts = MAX_READ_ATTEMPTS if idempotent else 1
+
+    for attempt in range(attempts):
+        timeout = call_timeout(deadline)
+        try:
+            # our retry loop replaces the client library's default retry
+            return method(*args, timeout=timeout, retry=no_retry(), **kwargs)
+        except Exception as ex:
+            if not is_transient(ex):
+                raise
+            if attempt == attempts - 1:
+                raise BackendUnavailable(f"{backend} unavailable") from ex
+
+        backoff = random.uniform(0, RETRY_BASE_SECONDS * 2**attempt)
+        if time.monotonic() + backoff >= deadline:
+            raise BackendUnavailable("request deadline exceeded")
+        inc_counter("backend_retries_total", (("backend", backend),))
+        time.sleep(backoff)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=HEDGE_CALLER_THREADS + MAX_HEDGES_IN_FLIGHT,
+                    thread_name_prefix="hedge",
+                )
+    return _executor
+
+
+def hedged(backend: str, call, deadline: float):
+    """
+    Runs call, sending a duplicate after HEDGE_AFTER_SECONDS if the first
+    hasn't finished and fewer than MAX_HEDGES_IN_FLIGHT duplicates are
+    running. Returns the first successful result.
+    call must not touch Flask request globals (it runs on a pool thread)
+    """
+    if HEDGE_AFTER_SECONDS <= 0:
+        return call()
+
+    executor = _get_executor()
+    pending = {executor.submit(call)}
+    done, pending = wait(pending, timeout=HEDGE_AFTER_SECONDS)
+
+    if not done and _hedge_slots.acquire(blocking=False):
+        inc_counter("backend_hedges_total", (("backend", backend),))
+        hedge = executor.submit(call)
+        hedge.add_done_callback(lambda _: _hedge_slots.release())
+        pending.add(hedge)
+
+    error = None
+    while True:
+        for future in done:
+            try:
+                return future.result()
+            except Exception as ex:
+                error = ex
+        if not pending:
+            raise error
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise BackendUnavailable("request deadline exceeded")
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+
+def init_resilience(app):
+    """
+    Starts a deadline budget per request and maps exhausted backends to 503
+    """
+    app.before_request(start_deadline)
+    app.register_error_handler(BackendUnavailable, lambda ex: get_error_message(503))
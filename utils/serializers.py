@@ -0,0 +1,99 @@
+from flask import request
+
+
+def resource_url_prefix(resource: str) -> str:
+    """
+    Builds the URL prefix for a resource once per request
+    e.g. http://host/courses/
+    """
+    return f"{request.host_url}{resource}/"
+
+
+COURSE_FIELDS = ("id", "subject", "number", "title", "term", "instructor_id", "self")
+USER_FIELDS = ("id", "role", "sub", "avatar_url", "courses")
+
+
+def parse_fields(value: str | None, allowed: tuple) -> set | None:
+    """
+    Parses a ?fields=id,title parameter
+    Returns None when absent, raises ValueError on unknown fields
+    """
+    if value is None:
+        return None
+
+    fields = {name.strip() for name in value.split(",") if name.strip()}
+    if not fields or not fields.issubset(allowed):
+        raise ValueError(value)
+
+    return fields
+
+
+def _int_or_none(value) -> int | None:
+    return None if value is None else int(value)
+
+
+def serialize_course(course: object, url_prefix: str = None, fields=None) -> dict:
+    """
+    Converts a course entity into its response representation
+    fields limits the response, the entity may then be a projection
+    """
+    if url_prefix is None:
+        url_prefix = resource_url_prefix("courses")
+
+    course_id = course.key.id
+    if fields is None:
+        return {
+            "id": course_id,
+            "subject": course["subject"],
+            "number": int(course["number"]),
+            "title": course["title"],
+            "term": course["term"],
+            "instructor_id": int(course["instructor_id"]),
+            "self": f"{url_prefix}{course_id}",
+        }
+
+    resource = {}
+    for name in COURSE_FIELDS:
+        if name not in fields:
+            continue
+        if name == "id":
+            resource[name] = course_id
+        elif name == "self":
+            resource[name] = f"{url_prefix}{course_id}"
+        elif name in ("number", "instructor_id"):
+            resource[name] = _int_or_none(course.get(name))
+        else:
+            resource[name] = course.get(name)
+
+    return resource
+
+
+def serialize_courses(courses: list[object], fields=None) -> list[dict]:
+    """
+    Converts a list of course entities, sharing one URL prefix
+    """
+    url_prefix = resource_url_prefix("courses")
+    return [serialize_course(course, url_prefix, fields) for course in courses]
+
+
+def serialize_user(
+    user: object, url_prefix: str = None, courses=None, fields=None
+) -> dict:
+    """
+    Converts a user entity into its response representation
+    avatar_url is only included when a url_prefix is given
+    and the user has an avatar
+    """
+    user_id = user.key.id
+    resource = {"id": user_id, "role": user.get("role"), "sub": user.get("sub")}
+
+    if url_prefix is not None and user.get("avatar"):
+        resource["avatar_url"] = f"{url_prefix}{user_id}/avatar"
+
+    if courses is not None:
+        resource["courses"] = courses
+
+    if fields is not None:
+        return {name: value for name, value in resource.items() if name in fields}
+
+    return resource
@@ -0,0 +1,59 @@
+import copy
+import threading
+
+from utils.metrics import inc_counter
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one backend call
+    Every caller, the leader included, gets a shallow copy of the result
+    so callers that mutate entities (e.g. PATCH handlers) don't affect
+    each other
+    """
+
+    def __init__(self, name: str, share=copy.copy):
+        self.name = name
+        self._share = share
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Runs fn for key, or waits for the in-flight call for the same key
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        labels = (("group", self.name), ("result", "leader" if leader else "collapsed"))
+        inc_counter("singleflight_calls_total", labels)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._share(call.result)
+
+        try:
+            call.result = fn()
+            # waiters copy call.result after done is set, by then the
+            # leader may already be mutating what it was handed
+            return self._share(call.result)
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -1,8 +1,32 @@
-from flask import request
-from google.cloud import datastore
+import os
+
+from flask import has_request_context, request
+from urllib.parse import urlencode
+
+from utils.clients import LazyDatastoreClient, new_entity, property_filter
+from utils.serializers import resource_url_prefix
+from utils.singleflight import SingleFlight
 
 test_server = "http://127.0.0.1:8080"
-client = datastore.Client()
+client = LazyDatastoreClient()
+
+# Datastore rejects commits with more than 500 mutations
+MAX_MUTATIONS = 500
+
+# Set to 0 once tools/migrate_enrollment.py has rewritten every legacy
+# auto-id enrollment row, to skip the extra query on removals
+LEGACY_ENROLLMENT_ROWS = os.environ.get("LEGACY_ENROLLMENT_ROWS", "1") == "1"
+
+# (sort, projected properties) composite indexes declared in index.yaml
+COURSE_PROJECTION_INDEXES = (("subject", "title"), ("subject", "number", "title"))
+
+# concurrent lookups of the same user/course share one Datastore read
+_user_reads = SingleFlight("users")
+_course_reads = SingleFlight("courses")
+
+# WSGI environ key for users looked up by sub in this request,
+# shared with sub-requests of POST /batch
+USERS_BY_SUB_KEY = "tarpaulin.users_by_sub"
 
 
 def generate_url(resource: str, resource_id: int = None, avatar=False) -> str:
@@ -10,9 +34,9 @@ def generate_url(resource: str, resource_id: int = None, avatar=False) -> str:
     creates URL for a resource
     """
     if avatar:
-        return f"{request.host_url}{resource}/{resource_id}/avatar"
+        return f"{resource_url_prefix(resource)}{resource_id}/avatar"
 
-    return f"{request.host_url}{resource}/{resource_id}"
+    return f"{resource_url_prefix(resource)}{resource_id}"
 
 
 def generate_next_page_url(resource: str, offset: int, limit: int):
@@ -22,6 +46,14 @@ def generate_next_page_url(resource: str, offset: int, limit: int):
     return f"{request.host_url}{resource}?offset={offset}&limit={limit}"
 
 
+def generate_cursor_page_url(resource: str, cursor: str, limit: int, params: dict):
+    """
+    Generate next page url for cursor paginated results
+    """
+    query_string = urlencode({**params, "cursor": cursor, "limit": limit})
+    return f"{request.host_url}{resource}?{query_string}"
+
+
 def generate_instructor_courses(user_id: int) -> list:
     """
     Generates an array of an instructor's courses' URLs
@@ -29,14 +61,13 @@ def generate_instructor_courses(user_id: int) -> list:
     results_array = []
 
     query = client.query(kind="courses")
-    query.add_filter(
-        filter=datastore.query.PropertyFilter("instructor_id", "=", user_id)
-    )
+    query.add_filter(filter=property_filter("instructor_id", "=", user_id))
+    query.keys_only()
     results = list(query.fetch())
+    url_prefix = resource_url_prefix("courses")
 
     for item in results:
-        course_url = generate_url("courses", item.key.id)
-        results_array.append(course_url)
+        results_array.append(f"{url_prefix}{item.key.id}")
 
     return results_array
 
@@ -47,12 +78,13 @@ def generate_student_courses(user_id: int) -> list:
     """
     results_array = []
     query = client.query(kind="enrollment")
-    query.add_filter(filter=datastore.query.PropertyFilter("student_id", "=", user_id))
+    query.add_filter(filter=property_filter("student_id", "=", user_id))
+    query.projection = ["course_id"]
     results = list(query.fetch())
+    url_prefix = resource_url_prefix("courses")
 
     for item in results:
-        course_url = generate_url("courses", item["course_id"])
-        results_array.append(course_url)
+        results_array.append(f"{url_prefix}{item['course_id']}")
 
     return results_array
 
@@ -62,7 +94,7 @@ def get_user_by_id(user_id: int) -> object:
     Retrieve user
     """
     user_key = client.key("users", user_id)
-    return client.get(key=user_key)
+    return _user_reads.do(user_id, lambda: client.get_hedged(user_key))
 
 
 def get_course_by_id(course_id: int) -> object:
@@ -70,17 +102,87 @@ def get_course_by_id(course_id: int) -> object:
     Retrieve course
     """
     course_key = client.key("courses", course_id)
-    return client.get(key=course_key)
+    return _course_reads.do(course_id, lambda: client.get_hedged(course_key))
+
+
+def get_courses_by_ids(course_ids: list[int]) -> tuple[list[object], list[int]]:
+    """
+    Retrieve several courses with a single get_multi call
+    Returns (courses in request order, ids that weren't found)
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    keys = [client.key("courses", course_id) for course_id in course_ids]
+    found = {course.key.id: course for course in client.get_multi(keys)}
+
+    courses = [found[course_id] for course_id in course_ids if course_id in found]
+    missing = [course_id for course_id in course_ids if course_id not in found]
+
+    return courses, missing
+
+
+def course_projection(fields: set | None, filters: dict, sort: str) -> list | None:
+    """
+    Picks the cheapest read for the requested fields
+    [] -> keys-only query, [props] -> projection query, None -> full entities
+    """
+    if fields is None:
+        return None
+
+    properties = fields - {"id", "self"}
+    if not properties:
+        return []
+
+    # projections need a composite index covering the sort and projected
+    # properties, so only unfiltered listings in the default order qualify
+    if filters or sort != "subject":
+        return None
+
+    for index in COURSE_PROJECTION_INDEXES:
+        if properties.issubset(index):
+            return list(index)
+
+    return None
+
+
+def build_course_query(filters: dict, sort: str, fields: set = None) -> object:
+    """
+    Builds a courses query with equality filters and a sort order
+    Composite indexes for these combinations are declared in index.yaml
+    """
+    query = client.query(kind="courses")
+
+    for name, value in filters.items():
+        query.add_filter(filter=property_filter(name, "=", value))
+
+    query.order = [sort]
+
+    projection = course_projection(fields, filters, sort)
+    if projection == []:
+        query.keys_only()
+    elif projection:
+        query.projection = projection
+
+    return query
 
 
 def get_user_by_sub(sub: str) -> list[object]:
     """
     retrieves user by sub
+    Results are cached for the rest of the request (and its batch)
     """
+    cache = None
+    if has_request_context():
+        cache = request.environ.setdefault(USERS_BY_SUB_KEY, {})
+        if sub in cache:
+            return cache[sub]
+
     query = client.query(kind="users")
-    query.add_filter(filter=datastore.query.PropertyFilter("sub", "=", sub))
+    query.add_filter(filter=property_filter("sub", "=", sub))
     results = list(query.fetch())
 
+    if cache is not None:
+        cache[sub] = results
+
     return results
 
 
@@ -88,8 +190,7 @@ def verify_user_id(sub: str, user_id: int) -> object | None:
     """
     Verifies JWT belongs to user_id, returns user entity
     """
-    user_key = client.key("users", user_id)
-    user = client.get(key=user_key)
+    user = get_user_by_id(user_id)
 
     return None if user["sub"] != sub else user
 
@@ -98,9 +199,7 @@ def verify_admin(sub: str) -> bool:
     """
     Verifies sub belongs to admin
     """
-    query = client.query(kind="users")
-    query.add_filter(filter=datastore.query.PropertyFilter("sub", "=", sub))
-    results = list(query.fetch())
+    results = get_user_by_sub(sub)
 
     return results[0]["role"] == "admin"
 
@@ -109,9 +208,7 @@ def verify_instructor_sub(sub: str) -> bool:
     """
     Verifies sub belongs to instructor
     """
-    query = client.query(kind="users")
-    query.add_filter(filter=datastore.query.PropertyFilter("sub", "=", sub))
-    results = list(query.fetch())
+    results = get_user_by_sub(sub)
 
     return results[0]["role"] == "instructor"
 
@@ -120,9 +217,7 @@ def verify_student_sub(sub: str) -> bool:
     """
     Verifies sub belongs to student
     """
-    query = client.query(kind="users")
-    query.add_filter(filter=datastore.query.PropertyFilter("sub", "=", sub))
-    results = list(query.fetch())
+    results = get_user_by_sub(sub)
 
     return results[0]["role"] == "student"
 
@@ -131,8 +226,7 @@ def verify_instructor(user_id: int) -> bool:
     """
     Verifies user id belongs to an instructor
     """
-    user_key = client.key("users", user_id)
-    user = client.get(key=user_key)
+    user = get_user_by_id(user_id)
 
     if not user:
         return False
@@ -144,8 +238,7 @@ def verify_student(user_id: int) -> bool:
     """
     Verifies that user id belongs to a student
     """
-    user_key = client.key("users", user_id)
-    user = client.get(key=user_key)
+    user = get_user_by_id(user_id)
 
     if not user:
         return False
@@ -174,38 +267,81 @@ def verify_enrollment_data(add: list[int], remove: list[int]) -> bool:
     return True
 
 
-def get_student_enrollment(student_id: int, course_id: int) -> list | None:
+def enrollment_key(course_id: int, student_id: int) -> object:
+    """
+    Deterministic enrollment key, one entity per (course, student) pair
+    """
+    return client.key("enrollment", f"{course_id}:{student_id}")
+
+
+def new_enrollment(course_id: int, student_id: int) -> object:
     """
-    Verifies that student is enrolled in a course
+    Builds an enrollment entity under its deterministic key
     """
+    enrollment = new_entity(enrollment_key(course_id, student_id))
+    enrollment.update({"student_id": student_id, "course_id": course_id})
+    return enrollment
+
+
+def legacy_enrollment_keys(course_id: int, student_id: int) -> list[object]:
+    """
+    Keys of auto-id enrollment rows for a (course, student) pair that
+    tools/migrate_enrollment.py hasn't rewritten yet
+    """
+    if not LEGACY_ENROLLMENT_ROWS:
+        return []
 
     query = client.query(kind="enrollment")
+    query.add_filter(filter=property_filter("course_id", "=", course_id))
+    query.add_filter(filter=property_filter("student_id", "=", student_id))
+    query.keys_only()
 
-    query.add_filter(
-        filter=datastore.query.PropertyFilter("student_id", "=", student_id)
-    )
-    query.add_filter(filter=datastore.query.PropertyFilter("course_id", "=", course_id))
-    results = list(query.fetch())
+    return [item.key for item in query.fetch() if item.key.id is not None]
 
-    results_array = []
-    for item in results:
-        results_array.append(item)
 
-    return results_array
+def put_in_batches(entities: list[object]):
+    """
+    put_multi in chunks that fit Datastore's per-commit mutation limit
+    """
+    for start in range(0, len(entities), MAX_MUTATIONS):
+        client.put_multi(entities[start : start + MAX_MUTATIONS])
 
 
-def cleanup_datastore_courses():
+def delete_in_batches(keys: list[object]):
     """
-    Clears out datastore Courses entity
+    delete_multi in chunks that fit Datastore's per-commit mutation limit
+    """
+    for start in range(0, len(keys), MAX_MUTATIONS):
+        client.delete_multi(keys[start : start + MAX_MUTATIONS])
+
+
+def delete_kind(kind: str, batch_size: int = MAX_MUTATIONS) -> int:
+    """
+    Deletes every entity of a kind with a keys-only query and delete_multi
        **For use during testing only**
     """
+    query = client.query(kind=kind)
+    query.keys_only()
 
-    query = client.query(kind="courses")
-    results = query.fetch()
+    deleted = 0
+    batch = []
+    for item in query.fetch():
+        batch.append(item.key)
+        if len(batch) == batch_size:
+            client.delete_multi(batch)
+            deleted += len(batch)
+            batch = []
 
-    for item in results:
-        key = client.key("courses", item.key.id)
-        client.delete(key)
+    client.delete_multi(batch)
+    return deleted + len(batch)
+
+
+def cleanup_datastore_courses():
+    """
+    Clears out datastore Courses entity
+       **For use during testing only**
+    """
+    delete_kind("courses")
 
 
 def cleanup_datastore_enrollment():
@@ -213,9 +349,4 @@ def cleanup_datastore_enrollment():
     Clears out datastore Enrollment entity
         **For use during testing only**
     """
-    query = client.query(kind="enrollment")
-    results = query.fetch()
-
-    for item in results:
-        key = client.key("enrollment", item.key.id)
-        client.delete(key)
+    delete_kind("enrollment")
@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+
+from utils.auth import get_jwks
+from utils.clients import get_datastore_client, get_storage_client
+
+PHOTO_BUCKET = "****"
+
+logger = logging.getLogger(__name__)
+
+# /_ah/warmup is unauthenticated, so the backend calls only run once per
+# process and later hits get the first report back
+_warmup_lock = threading.Lock()
+_report = None
+
+
+def _timed(step) -> dict:
+    """
+    Runs a warmup step, returning whether it worked and its duration
+    Errors are logged rather than returned, the endpoint is public
+    """
+    start = time.perf_counter()
+    try:
+        step()
+        ok = True
+    except Exception as ex:
+        logger.warning("warmup step %s failed: %s", step.__name__, type(ex).__name__)
+        ok = False
+    return {"ok": ok, "ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+def _warm_imports():
+    # modules deferred at import time to keep cold starts short
+    import jose.jwt  # noqa: F401
+    import requests  # noqa: F401
+
+
+def _warm_datastore():
+    # a keys-only read opens the gRPC channel and TLS session
+    client = get_datastore_client()
+    query = client.query(kind="courses")
+    query.keys_only()
+    list(query.fetch(limit=1))
+
+
+def _warm_storage():
+    get_storage_client().bucket(PHOTO_BUCKET).exists()
+
+
+def warm_up() -> dict:
+    """
+    Builds backend clients and primes connections and caches, once per process
+    Returns a report of each step and the total time taken
+    """
+    global _report
+    with _warmup_lock:
+        if _report is None:
+            _report = _warm_up()
+        return _report
+
+
+def _warm_up() -> dict:
+    start = time.perf_counter()
+    steps = {
+        "imports": _timed(_warm_imports),
+        "datastore": _timed(_warm_datastore),
+        "storage": _timed(_warm_storage),
+        "jwks": _timed(get_jwks),
+    }
+
+    return {
+        "warmed": steps,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+    }